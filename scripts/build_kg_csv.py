@@ -11,20 +11,33 @@ to build a structured medical knowledge graph in CSV format.
 
 # Import necessary libraries
 import re
+import os
+import mmap
+import csv
 import pandas as pd
 import spacy
 import nltk
-from fuzzywuzzy import process
+import difflib
 from nltk.stem import WordNetLemmatizer
 from datetime import datetime
+from functools import lru_cache
+from collections import defaultdict
 import argparse
 
+try:
+    from rapidfuzz import process, fuzz, utils
+    rapidfuzz_available = True
+except ImportError:  # Soft fallback to the standard library matcher
+    rapidfuzz_available = False
+    print("Warning: rapidfuzz not found, falling back to difflib for fuzzy matching.")
+
 # Start timestamp
 start_time = datetime.now()
 print(f"Script started at: {start_time}")
 
 nltk.download("wordnet")
-nlp_bc5cdr = spacy.load("en_ner_bc5cdr_md")  # Model for biomedical NER
+# Model for biomedical NER; only the NER output (doc.ents) is used, so the other components are not loaded
+nlp_bc5cdr = spacy.load("en_ner_bc5cdr_md", exclude=["tagger", "parser", "attribute_ruler", "lemmatizer"])
 
 # Initialize NLTK Lemmatizer
 lemmatizer = WordNetLemmatizer()
@@ -42,6 +55,21 @@ csv_output_path = args.output
 # Load predefined medical terms for fuzzy matching
 with open(medical_terms_file, "r", encoding="utf-8") as f:
     medical_terms = [line.strip().lower() for line in f.readlines()]
+medical_terms_set = set(medical_terms)  # For O(1) checks of entities that are already known terms
+# Terms in the form compared by the fuzzy matcher (preprocessed once for RapidFuzz)
+match_terms = [utils.default_process(term) for term in medical_terms] if rapidfuzz_available else medical_terms
+# Bucket the terms by first character, so each entity is only scored against the terms sharing its first character
+term_buckets = defaultdict(list)
+for index, term in enumerate(match_terms):
+    if term:
+        term_buckets[term[0]].append(index)
+all_term_indices = list(range(len(medical_terms)))  # Candidates for entities whose first character has no bucket
+# First term index for each matcher form, so entities that equal a known term skip the fuzzy scoring.
+# The first index is what the argmax over a bucket would pick among equal scores.
+exact_term_index = {}
+for index, term in enumerate(match_terms):
+    if term:
+        exact_term_index.setdefault(term, index)
 
 # Define relationship mappings
 relationship_mappings = {
@@ -67,36 +95,83 @@ unit_mapping = {
     "nanogram": "ng",
     "kilogram": "kg",
 }
+# Dosage values in mg, matching "mg" and its long forms from unit_mapping, so units are standardized
+# and the number is extracted in a single regex pass over each dosage string
+mg_unit_aliases = "|".join(re.escape(unit) for unit, short_unit in unit_mapping.items() if short_unit == "mg")
+mg_value_pattern = re.compile(rf"(\d+)\s*(?:mg|\b(?i:{mg_unit_aliases})\b)")
 
-# Function to normalize medical entities
-def normalize_medical_entity(entity):
-    doc = nlp_bc5cdr(entity.lower())
-    if doc.ents:
-        return doc.ents[0].text  
-    return entity 
+# Function to normalize medical entities in a single batched pass through the NER model
+def normalize_medical_entities(entities, batch_size=512):
+    """
+    Normalizes a batch of entities with nlp_bc5cdr.pipe instead of one model call per entity.
+    Entities that already match a known medical term are returned lowercased without running the model.
+    Returns a dict mapping each entity to its first recognized entity text, or to itself if none is found.
+    """
+    entities = list(dict.fromkeys(entities))  # Run the model once per unique entity
+    normalized = {}
+    unknown = []
+    for entity in entities:
+        if entity.lower() in medical_terms_set:  # Already a known term, so the model pass is skipped
+            normalized[entity] = entity.lower()
+        else:
+            unknown.append(entity)
+    docs = nlp_bc5cdr.pipe((entity.lower() for entity in unknown), batch_size=batch_size)
+    for entity, doc in zip(unknown, docs):
+        normalized[entity] = doc.ents[0].text if doc.ents else entity
+    return normalized
 
-# Function to lemmatize words
+# Function to lemmatize words, memoized since the same terms repeat heavily across leaflets
+@lru_cache(maxsize=None)
 def lemmatize_entity(entity):
+    if entity.lower() in medical_terms_set:  # Known terms are kept as they are
+        return entity.lower()
     return lemmatizer.lemmatize(entity.lower())
 
 # Function to apply fuzzy matching using the list of curated medical terms
-def fuzzy_match_entity(entity):
-    match, score = process.extractOne(entity, medical_terms)
-    return match if score > 85 else entity  # Replace if confidence > 85%
+def fuzzy_match_entities(entities, batch_size=256):
+    """
+    Fuzzy matches a batch of entities against the curated medical terms in one process.cdist call per batch.
+    Each entity is only scored against the bucket of terms sharing its first character.
+    Entities that equal a known term are resolved by lookup, since no other term can score higher,
+    so only the remaining entities reach the edit-distance scoring.
+    Returns a dict mapping each entity to its best matching term, or to itself if confidence <= 85%.
+    Uses difflib.get_close_matches instead when rapidfuzz is not installed.
+    """
+    entities = list(dict.fromkeys(entities))  # Score each unique entity only once
+    matched = {}
+    groups = defaultdict(list)  # Bucket key -> (entity, query) pairs scored against that bucket
+    for entity in entities:
+        query = utils.default_process(entity) if rapidfuzz_available else entity
+        if query in exact_term_index:  # An exact match scores 100, the same result the scoring below would give
+            matched[entity] = medical_terms[exact_term_index[query]]
+            continue
+        key = query[0] if query and query[0] in term_buckets else None
+        groups[key].append((entity, query))
 
-# Function to standardize dosage units
-def standardize_dosage(dosage):
-    for long_unit, short_unit in unit_mapping.items():
-        dosage = re.sub(rf"\b{long_unit}\b", short_unit, dosage, flags=re.IGNORECASE)
-    return dosage
+    for key, group in groups.items():
+        candidates = term_buckets[key] if key is not None else all_term_indices
+        candidate_terms = [match_terms[i] for i in candidates]
+        if not rapidfuzz_available:
+            for entity, query in group:
+                matches = difflib.get_close_matches(query, candidate_terms, n=1, cutoff=0.85)
+                matched[entity] = matches[0] if matches else entity
+            continue
+        for start in range(0, len(group), batch_size):  # Batches keep the (N, M) score matrix small
+            batch = group[start:start + batch_size]
+            queries = [query for _, query in batch]
+            scores = process.cdist(queries, candidate_terms, scorer=fuzz.WRatio, score_cutoff=85, workers=-1)
+            best_indices = scores.argmax(axis=1)
+            best_scores = scores.max(axis=1)
+            for (entity, _), index, score in zip(batch, best_indices, best_scores):
+                matched[entity] = medical_terms[candidates[index]] if score > 85 else entity  # Replace if confidence > 85%
+    return matched
 
 # Function to extract min and max dosage values
 def extract_dosage_values(dosage_list):
     numeric_values = []
     contains_prescribed_text = False
     for dosage in dosage_list:
-        dosage = standardize_dosage(dosage) 
-        match = re.search(r"(\d+)\s*mg", dosage)  
+        match = mg_value_pattern.search(dosage)  # Matches both standardized and long-form mg units
         if match:
             numeric_values.append(int(match.group(1)))  
         elif "Dosage to be prescribed by doctor" in dosage:
@@ -108,72 +183,95 @@ def extract_dosage_values(dosage_list):
     return []
 
 
-# Read the TXT file and extract relationships
-data = []
+medical_relations = {
+    "HAS_SIDE_EFFECT",
+    "HAS_ACTIVE_INGREDIENT",
+    "HAS_INACTIVE_INGREDIENT",
+    "HAS_CONTRAINDICATION",
+    "HAS_WARNING",
+}
+
+# Function to read the text file line by line
+def read_lines(path):
+    """Yield the decoded lines of a text file lazily through a read-only memory map."""
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:  # An empty file cannot be memory-mapped
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b""):
+                yield line.decode("utf-8")
+
+# Function to add the min/max dosage rows collected for one dosage question
+def add_dosage_rows(subject, dosage_lines):
+    processed_dosages = extract_dosage_values(dosage_lines)
+    for dosage in processed_dosages:
+        data.append([subject, "HAS_DOSAGE_INFO", dosage])
+
+# Read the TXT file and extract relationships in a single forward pass
+data = []  # Raw rows; comma-list answers keep a list-typed Object until they are exploded
 current_drug = None
 drug_name_mapping = {}  
-with open(txt_file_path, "r", encoding="utf-8") as file:
-    lines = file.readlines()
-for i, line in enumerate(lines):
-    line = line.strip()
+pending_relation = None  # Relation of the last question, waiting for its "A: " line
+dosage_lines = None  # Dosage lines collected since the last dosage question, until the next question
+for raw_line in read_lines(txt_file_path):
+    line = raw_line.strip()
     if line.startswith("Drug Leaflet:"):
         current_pdf = line.split(":")[1].strip()  # Store PDF filename
         print(f"Processing drug leaflet: {current_pdf} at {datetime.now()}")  # Timestamp each leaflet start
-    if line.startswith("Q: What is the name of the drug/medicine?"):
-        answer_line = next((l.strip() for l in lines[i + 1:] if l.startswith("A: ")), None)
-        if answer_line:
-            current_drug = answer_line.replace("A: ", "").strip()
-            drug_name_mapping[current_pdf] = current_drug  # Store drug name mapping
+
+    if line.startswith("Q: "):
+        if dosage_lines is not None:  # A new question ends the previous dosage block
+            add_dosage_rows(dosage_subject, dosage_lines)
+            dosage_lines = None
+        pending_relation = relationship_mappings.get(line[3:])  # Map known questions to relationship types
+        if pending_relation == "HAS_DOSAGE_INFO":
+            dosage_subject = drug_name_mapping.get(current_pdf, current_pdf)
+            dosage_lines = []
+            pending_relation = None
+        continue
+
+    if dosage_lines is not None and line.startswith("- "):
+        dosage_lines.append(line.replace("- ", "").strip())
 
     # Extract entities & relationships
-    for question, relation in relationship_mappings.items():
-        if line.startswith(f"Q: {question}"):
-            answer_line = next((l.strip() for l in lines[i + 1:] if l.startswith("A: ")), None)
-            if answer_line:
-                answer = answer_line.replace("A: ", "").strip()
-                subject = drug_name_mapping.get(current_pdf, current_pdf)
-                if relation == "HAS_DOSAGE_INFO":
-                    dosage_lines = []
-                    for j in range(i + 1, len(lines)):
-                        if lines[j].strip().startswith("- "):
-                            dosage_lines.append(lines[j].strip().replace("- ", "").strip())
-                        elif lines[j].strip().startswith("Q: "):
-                            break
-                    processed_dosages = extract_dosage_values(dosage_lines)
-                    for dosage in processed_dosages:
-                        data.append([subject, relation, dosage])
-                elif relation == "HAS_STORAGE_INFO":
-                    data.append([subject, relation, answer])
-                elif relation == "HAS_COLOUR":
-                    colors = [c.strip() for c in answer.split(",")]
-                    for color in colors:
-                        data.append([subject, relation, color])
-                elif relation in {
-                    "HAS_SIDE_EFFECT",
-                    "HAS_ACTIVE_INGREDIENT",
-                    "HAS_INACTIVE_INGREDIENT",
-                    "HAS_CONTRAINDICATION",
-                    "HAS_WARNING",
-                }:
-                    if "," in answer:
-                        values = [v.strip() for v in answer.split(",")]
-                        for value in values:
-                            normalized = normalize_medical_entity(value)
-                            lemmatized = lemmatize_entity(normalized)
-                            matched = fuzzy_match_entity(lemmatized)
-                            data.append([subject, relation, matched])
-                    else:
-                        normalized = normalize_medical_entity(answer)
-                        lemmatized = lemmatize_entity(normalized)
-                        matched = fuzzy_match_entity(lemmatized)
-                        data.append([subject, relation, matched])
-                else:
-                    data.append([subject, relation, answer])
-
-
-df = pd.DataFrame(data, columns=["Subject", "Predicate", "Object"])
-df.drop_duplicates(inplace=True)
-df.to_csv(csv_output_path, index=False)
+    if pending_relation and raw_line.startswith("A: "):
+        relation = pending_relation
+        pending_relation = None
+        answer = line[3:].strip()
+        if relation == "HAS_NAME":
+            current_drug = answer
+            drug_name_mapping[current_pdf] = current_drug  # Store drug name mapping
+        subject = drug_name_mapping.get(current_pdf, current_pdf)
+        if relation == "HAS_STORAGE_INFO":
+            data.append([subject, relation, answer])
+        elif relation == "HAS_COLOUR" or relation in medical_relations:
+            data.append([subject, relation, answer.split(",")])
+        else:
+            data.append([subject, relation, answer])
+if dosage_lines is not None:  # The file may end inside a dosage block
+    add_dosage_rows(dosage_subject, dosage_lines)
+
+# Explode the comma-list answers into one row per value, keeping the original row order
+triples = pd.DataFrame(data, columns=["Subject", "Predicate", "Object"]).explode("Object", ignore_index=True)
+triples["Object"] = triples["Object"].str.strip()
+
+# Normalize, lemmatize and fuzzy match all medical entities in batches, then map the results back per column
+is_medical = triples["Predicate"].isin(medical_relations)
+medical_objects = triples.loc[is_medical, "Object"]
+normalized_entities = normalize_medical_entities(medical_objects)
+lemmatized_entities = {entity: lemmatize_entity(normalized) for entity, normalized in normalized_entities.items()}
+matched_entities = fuzzy_match_entities(lemmatized_entities.values())
+triples.loc[is_medical, "Object"] = medical_objects.map(lemmatized_entities).map(matched_entities)
+
+# Write the triples straight to the CSV, dropping duplicates with a set instead of building a DataFrame
+seen = set()
+with open(csv_output_path, "w", encoding="utf-8", newline="") as csv_file:
+    writer = csv.writer(csv_file, quoting=csv.QUOTE_MINIMAL, lineterminator=os.linesep)
+    writer.writerow(["Subject", "Predicate", "Object"])
+    for triple in triples.itertuples(index=False, name=None):
+        if triple not in seen:
+            seen.add(triple)
+            writer.writerow(triple)
 end_time = datetime.now()
 
 # Print summary
@@ -1,65 +1,87 @@
 # Import necessary libraries
+import numpy as np
 import pandas as pd
 import re
 import os
 import argparse
 
-def clean_kg(input_path, output_path):
-    """
-    Cleans the post-processed dataset by removing nulls, placeholder entries,
-    noisy patterns, short meaningless objects, and duplicates. The output generated serves as the final dataset ready to be used.
-    """
-    if not os.path.exists(input_path):
-        raise FileNotFoundError(f"Input file not found: {input_path}")
+# ------------------ Noise patterns, compiled once at import ------------------
+# Step 2: Known noisy values in 'Subject' and 'Object'
+placeholder_start_pattern = (
+    r"^(data not|none|unknown|not found|not given|not available|"
+    r"drug name not found|not provided|not|name not given|"
+    r"inadequate data|insufficient data)\b"
+)
 
-    # Load dataset
-    df = pd.read_csv(input_path)
+# Step 3: Noisy values in 'Object' column
+object_contains_pattern = (
+    r"(unknown|inadequate data|insufficient data|no colour|no shape|"
+    r"no warning|no contraindication|no data|no information)\b"
+)
 
+# Step 4: Noisy values in 'Subject' column
+subject_flag_phrases = ['product name', 'not stated', 'invented name', 'unreadable text']
+subject_flag_pattern = '|'.join([re.escape(p) for p in subject_flag_phrases])
+
+# Steps 2-4 are fused into one pattern per column, so each column is scanned only once
+subject_noise_pattern = re.compile(f"(?:{placeholder_start_pattern})|(?:{subject_flag_pattern})", re.IGNORECASE)
+object_noise_pattern = re.compile(f"(?:{placeholder_start_pattern})|(?:{object_contains_pattern})", re.IGNORECASE)
+
+# Step 5: Leading/trailing special characters
+specials_pattern = re.compile(r"^[^A-Za-z0-9]+|[^A-Za-z0-9]+$")
+
+def clean_chunk(df):
+    """
+    Applies the row-level cleaning steps (nulls, placeholder entries, noisy patterns,
+    special characters and short meaningless objects) to one chunk of the dataset.
+    """
     # Step 1: Remove null 'Subject' or 'Object'
     df = df[~(df['Subject'].isna() | df['Object'].isna())]
 
-    # Step 2: Remove known noisy values from 'Subject' and 'Object'
-    placeholder_start_pattern = (
-        r"^(data not|none|unknown|not found|not given|not available|"
-        r"drug name not found|not provided|not|name not given|"
-        r"inadequate data|insufficient data)\b"
-    )
-    mask_placeholder = (
-        df['Subject'].str.contains(placeholder_start_pattern, case=False, na=False) |
-        df['Object'].str.contains(placeholder_start_pattern, case=False, na=False)
-    )
-    df = df[~mask_placeholder]
-
-    # Step 3: Remove noisy values in 'Object' column
-    object_contains_pattern = (
-        r"(unknown|inadequate data|insufficient data|no colour|no shape|"
-        r"no warning|no contraindication|no data|no information)\b"
+    # Steps 2-4: Remove known noisy values from 'Subject' and 'Object' in one scan per column
+    mask_noise = (
+        df['Subject'].str.contains(subject_noise_pattern, na=False).to_numpy() |
+        df['Object'].str.contains(object_noise_pattern, na=False).to_numpy()
     )
-    df = df[~df['Object'].str.contains(object_contains_pattern, case=False, na=False)]
-
-    # Step 4: Remove noisy values in 'Subject' column
-    subject_flag_phrases = ['product name', 'not stated', 'invented name', 'unreadable text']
-    subject_flag_pattern = '|'.join([re.escape(p) for p in subject_flag_phrases])
-    df = df[~df['Subject'].str.contains(subject_flag_pattern, case=False, na=False)]
+    df = df[~mask_noise]
 
     # Step 5: Clean special characters
-    def clean_specials(text):
-        if isinstance(text, str):
-            return re.sub(r"^[^A-Za-z0-9]+|[^A-Za-z0-9]+$", "", text.strip())
-        return text
+    df['Subject'] = df['Subject'].str.replace(specials_pattern, "", regex=True)
+    df['Object'] = df['Object'].str.replace(specials_pattern, "", regex=True)
 
-    df['Subject'] = df['Subject'].apply(clean_specials)
-    df['Object'] = df['Object'].apply(clean_specials)
+    # Step 7: Remove specific unwanted values (Object is already stripped by step 5)
+    target_values = {'c', 'ig', 'na'}
+    obj_lower = df['Object'].str.lower()
+    df = df[~obj_lower.isin(target_values)]
+    return df
+
+def clean_kg(input_path, output_path, chunksize=200_000):
+    """
+    Cleans the post-processed dataset by removing nulls, placeholder entries,
+    noisy patterns, short meaningless objects, and duplicates. The output generated serves as the final dataset ready to be used.
+    The input is streamed in chunks and written incrementally, so only one chunk is held in memory at a time.
+    """
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"Input file not found: {input_path}")
 
-    # Step 6: Drop duplicates
-    df = df.drop_duplicates()
+    seen = set()  # Rows already written, used to drop duplicates across chunks
+    first_chunk = True
+    # dtype=str keeps every chunk string-typed, even one whose values all look numeric
+    with pd.read_csv(input_path, chunksize=chunksize, engine='c', dtype=str) as reader, \
+            open(output_path, 'w', encoding='utf-8', newline='') as out:
+        for chunk in reader:
+            chunk = clean_chunk(chunk)
 
-    # Step 7: Remove specific unwanted values
-    target_values = {'c', 'ig', 'na'}
-    df = df[~df['Object'].astype(str).str.strip().str.lower().isin(target_values)]
+            # Step 6: Drop duplicates
+            is_new = np.zeros(len(chunk), dtype=bool)  # A boolean mask, so an empty chunk keeps its columns
+            for i, row in enumerate(chunk.itertuples(index=False, name=None)):
+                is_new[i] = row not in seen
+                seen.add(row)
+            chunk = chunk[is_new]
 
-    # Save cleaned file
-    df.to_csv(output_path, index=False)
+            # Save cleaned chunk
+            chunk.to_csv(out, header=first_chunk, index=False)
+            first_chunk = False
     print(f"Cleaned dataset saved to: {output_path}")
 
 if __name__ == "__main__":
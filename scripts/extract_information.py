@@ -3,16 +3,21 @@ Script to extract structured medical Q&A pairs from HPRA drug leaflet PDFs using
 It converts PDF text to plain text, then queries a chat-style language model to extract drug-related facts like name, side-effects, dosage, storage, appearance and so on.
 
 Main Phases:
-1. PDF to text extraction (with timeout handling)
-2. LLM-powered extraction of structured drug attributes
+1. PDF to text extraction (parallel worker processes with timeout handling)
+2. LLM-powered extraction of structured drug attributes (independent questions are sent concurrently)
 3. Optional refinement using follow-up LLM queries (e.g., standardizing dosage or shape/color)
 """
 # ------------------ Import necessary libraries ------------------
 import os
-import requests
+import asyncio
+import httpx
+import hashlib
+import diskcache
 import logging
+import itertools
 import multiprocessing
-from PyPDF2 import PdfReader
+from collections import deque
+import fitz
 import time
 import argparse
 
@@ -22,12 +27,16 @@ parser.add_argument("--pdf_dir", required=True, help="Directory containing the P
 parser.add_argument("--output", required=True, help="Path to save the extracted Q&A .txt file")
 parser.add_argument("--llm_url", required=True, help="URL of the LLM endpoint")
 parser.add_argument("--llm_model", required=True, help="Name of the LLM model to be used")
+parser.add_argument("--cache_dir", default=".llm_cache", help="Directory of the on-disk cache of LLM responses")
 args = parser.parse_args()
 
 folder_path = args.pdf_dir
 output_txt = args.output
 LLM_URL = args.llm_url
 LLM_MODEL = args.llm_model
+llm_cache = diskcache.Cache(args.cache_dir)  # Successful LLM responses, reused across runs
+SYSTEM_PROMPT = "You are an expert in medical drug information extraction. Respond concisely."
+MAX_TOKENS = 500
 
 # ------------------ Logging ------------------
 logging.basicConfig(
@@ -37,12 +46,15 @@ logging.basicConfig(
 )
 
 # ------------------ Utility Functions ------------------
-def is_already_processed(filename):
-    """Check if a given PDF filename has already been processed and logged in the output file."""
+def load_processed_files():
+    """Collect the PDF filenames already processed and logged in the output file, reading it only once."""
+    processed = set()
     if os.path.exists(output_txt):
         with open(output_txt, "r", encoding="utf-8") as f:
-            return f"Drug Leaflet: {filename}" in f.read()
-    return False
+            for line in f:
+                if line.startswith("Drug Leaflet:"):
+                    processed.add(line.split(":", 1)[1].strip())
+    return processed
 
 def split_list_values(values):
     """Split a stringified list (comma-separated) into a Python list, cleaning brackets and quotes."""
@@ -51,91 +63,121 @@ def split_list_values(values):
         return [val.strip() for val in values.split(',')]
     return values if isinstance(values, list) else [values]
 
-def extract_text_worker(pdf_path, result_queue):
-    """Worker function to extract text from a PDF using PyPDF2. Runs in a subprocess for timeout control."""
+def extract_text_worker(pdf_path):
+    """Worker function to extract text from a PDF using PyMuPDF (fitz). Runs in a worker process for timeout control."""
+    with fitz.open(pdf_path) as doc:
+        text = "\n".join(page.get_text() for page in doc)
+    if not text.strip():
+        raise ValueError("Extracted text is empty")
+    return text
+
+def extract_texts_from_pdfs(pdf_paths, timeout=120, max_workers=None):
+    """
+    Extract text from PDFs in parallel using a pool of worker processes, with a timeout limit to prevent hangs or crashes.
+    Yields (pdf_path, text) pairs in input order; text is None if extraction failed or timed out.
+    Only a small window of PDFs is extracted ahead of the consumer, so finished texts do not pile up in memory.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    pdf_paths = iter(pdf_paths)
+    pool = multiprocessing.Pool(max_workers)
+    pending = deque()
     try:
-        reader = PdfReader(pdf_path)
-        text = "".join(page.extract_text() or "" for page in reader.pages)
-        if not text.strip():
-            raise ValueError("Extracted text is empty")
-        result_queue.put(text)
-    except Exception as e:
-        result_queue.put(f"ERROR: {e}")
-
-def extract_text_from_pdf(pdf_path, timeout=120):
-    """Safely extract text from a PDF with a timeout limit to prevent hangs or crashes."""
-    result_queue = multiprocessing.Queue()
-    process = multiprocessing.Process(target=extract_text_worker, args=(pdf_path, result_queue))
-    process.start()
-    process.join(timeout)
-    if process.is_alive():
-        logging.error(f"Timeout reached for {pdf_path}. Terminating process.")
-        process.terminate()
-        process.join()
-        return None
-    extracted_text = result_queue.get() if not result_queue.empty() else None
-    if extracted_text and extracted_text.startswith("ERROR:"):
-        logging.error(f"Error extracting text from {pdf_path}: {extracted_text[7:]}")
-        return None
-    return extracted_text
-
-def query_model(context, question, filename, retries=3, delay=5):
-    """Query the LLM with a given context and question. Retry on failure, log responses."""
+        for pdf_path in itertools.islice(pdf_paths, 2 * max_workers):
+            pending.append((pdf_path, pool.apply_async(extract_text_worker, (pdf_path,))))
+        while pending:
+            pdf_path, result = pending.popleft()
+            try:
+                text = result.get(timeout=timeout)
+            except multiprocessing.TimeoutError:
+                logging.error(f"Timeout reached for {pdf_path}. Terminating worker processes and skipping file.")
+                # A hung worker never returns its slot, so replace the whole pool and resubmit the PDFs still waiting
+                pool.terminate()
+                pool.join()
+                pool = multiprocessing.Pool(max_workers)
+                pending = deque((path, pool.apply_async(extract_text_worker, (path,))) for path, _ in pending)
+                text = None
+            except Exception as e:
+                logging.error(f"Error extracting text from {pdf_path}: {e}")
+                text = None
+            next_path = next(pdf_paths, None)
+            if next_path is not None:
+                pending.append((next_path, pool.apply_async(extract_text_worker, (next_path,))))
+            yield pdf_path, text
+    finally:
+        pool.terminate()  # Nothing is left to wait for, and a stopped consumer should not leave workers running
+        pool.join()
+
+async def query_model(client, context, question, filename, retries=3, delay=5):
+    """
+    Query the LLM with a given context and question on the shared async client. Retry on failure, log responses.
+    Successful responses are cached on disk by the full request (model, system prompt, max tokens, question, context),
+    so re-runs skip the LLM call and a changed prompt never serves a stale answer.
+    """
+    key = "\x1f".join([LLM_MODEL, SYSTEM_PROMPT, str(MAX_TOKENS), question, context])
+    cache_key = hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        logging.info(f"Using cached LLM response for file: {filename} | Question: '{question}'")
+        return cached
     data = {
         "model": LLM_MODEL,
         "messages": [
-            {"role": "system", "content": "You are an expert in medical drug information extraction. Respond concisely."},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": f"Context: {context}\n\nQuestion: {question}"}
         ],
-        "max_tokens": 500,
+        "max_tokens": MAX_TOKENS,
     }
     for attempt in range(retries):
         try:
             logging.info(f"Attempt {attempt+1}: Querying LLM for file: {filename} | Question: '{question}'")
             start_time = time.time()
-            response = requests.post(LLM_URL, json=data, timeout=30)
+            response = await client.post(LLM_URL, json=data)
             duration = time.time() - start_time
             logging.info(f"LLM response received in {duration:.2f} seconds for {filename}")
             response.raise_for_status()
-            time.sleep(1)
-            return response.json().get("choices", [{}])[0].get("message", {}).get("content", None)
-        except requests.exceptions.Timeout:
+            content = response.json().get("choices", [{}])[0].get("message", {}).get("content", None)
+            if content is not None:
+                llm_cache.set(cache_key, content)
+            return content
+        except httpx.TimeoutException:
             logging.error(f"Timeout on attempt {attempt+1} for {filename}. Retrying in {delay} sec...")
-            time.sleep(delay)
-        except requests.exceptions.RequestException as e:
+            await asyncio.sleep(delay)
+        except (httpx.HTTPError, ValueError) as e:  # ValueError covers a response body that is not valid JSON
             logging.error(f"Request failed for {filename} on attempt {attempt+1}: {e}")
         if attempt == retries - 1:
             return None
 
-def extract_temperature_info(storage_text, filename):
+async def extract_temperature_info(client, storage_text, filename):
     """Use the LLM to refine storage temperature from extracted storage text."""
     if isinstance(storage_text, str):
         refined_question = "From the extracted storage information, classify the storage condition only as '> X degrees', '< X degrees', 'X - Y degrees', or 'No special storage'. Extract and replace the actual numeric value of X or Y with the extracted value. Do not generate any extra information."
-        refined_storage = query_model(storage_text, refined_question, filename)
+        refined_storage = await query_model(client, storage_text, refined_question, filename)
         return refined_storage.strip() if refined_storage else "No special storage"
     return "No special storage"
 
-def extract_dosage_info(dosage_text, filename):
+async def extract_dosage_info(client, dosage_text, filename):
     """Use the LLM to break down dosage into standardized formats for Adults, Children, Elderly."""
     if isinstance(dosage_text, str):
         refined_question = "From the extracted dosage information, extract and categorize doses as 'Adults (General)', 'Children', 'Elderly' only. Format as '<Category> - <X mg a day>' and return each dose in a separate line. Ignore subcategories. If no specific dosage amount in mg is available, return 'Dosage to be prescribed by doctor'. Do not generate any extra information."
-        refined_dosage = query_model(dosage_text, refined_question, filename)
+        refined_dosage = await query_model(client, dosage_text, refined_question, filename)
         if refined_dosage is None:
             return []
         return refined_dosage.split('\n') if refined_dosage else []
     return []
 
-def extract_appearance_info(appearance_text, filename):
+async def extract_appearance_info(client, appearance_text, filename):
     """Use the LLM to extract shape and color of the drug from appearance description."""
     if isinstance(appearance_text, str):
         shape_question = "From the extracted drug appearance description, extract only the shape of the drug as a single word. For multiple shapes list only the name of the shapes separated by comma. Do not generate any extra information."
         color_question = "From the extracted drug appearance description, extract only the color of the drug as a single word. For multiple colours list only the name of the colours separated by comma. Do not generate any extra information."
-        shape = query_model(appearance_text, shape_question, filename)
-        color = query_model(appearance_text, color_question, filename)
+        shape, color = await asyncio.gather(
+            query_model(client, appearance_text, shape_question, filename),
+            query_model(client, appearance_text, color_question, filename),
+        )
         return split_list_values(shape) if shape else [], split_list_values(color) if color else []
     return [], []
 
-def process_pdfs(folder_path):
+async def process_pdfs(folder_path):
     """Main function: loops through PDFs, extracts Q&A info via LLM, and writes results to .txt."""
     questions = [
         ("Drug", "HAS_NAME", "What is the name of the drug/medicine? Provide only the name."),
@@ -148,75 +190,95 @@ def process_pdfs(folder_path):
         ("Drug", "HAS_DOSAGE_INFO", "Extract dosage instructions as a paragraph."),
         ("Drug", "HAS_APPEARANCE", "Extract how the drug looks as a paragraph."),
     ]
+    refinements = {
+        "HAS_STORAGE_INFO": extract_temperature_info,
+        "HAS_DOSAGE_INFO": extract_dosage_info,
+        "HAS_APPEARANCE": extract_appearance_info,
+    }
 
-    with open(output_txt, mode='a', encoding='utf-8') as txtfile:
-        for filename in sorted([f for f in os.listdir(folder_path) if f.endswith(".pdf")]):
-            if is_already_processed(filename):
-                logging.info(f"Skipping already processed file: {filename}")
-                continue
+    processed = load_processed_files()
+    pdf_files = sorted([f for f in os.listdir(folder_path) if f.endswith(".pdf")])
+    pending_files = []
+    for filename in pdf_files:
+        if filename in processed:
+            logging.info(f"Skipping already processed file: {filename}")
+            continue
+        pending_files.append(filename)
 
-            pdf_path = os.path.join(folder_path, filename)
-            logging.info(f"Processing file: {pdf_path}")
+    pdf_paths = [os.path.join(folder_path, filename) for filename in pending_files]
+    # One pooled HTTP/2 client is shared by all queries, so connections are reused across questions and PDFs
+    limits = httpx.Limits(max_connections=16)
+    async with httpx.AsyncClient(http2=True, limits=limits, timeout=30) as client:
+        with open(output_txt, mode='a', encoding='utf-8') as txtfile:
+            # PDFs are extracted ahead in worker processes while the LLM queries for the current PDF run
+            for pdf_path, context in extract_texts_from_pdfs(pdf_paths):
+                filename = os.path.basename(pdf_path)
+                logging.info(f"Processing file: {pdf_path}")
 
-            try:
-                context = extract_text_from_pdf(pdf_path)
                 if not context:
-                    raise ValueError("Empty text extracted.")
-            except Exception as e:
-                logging.error(f"Error processing {filename}: {e}")
-                continue
+                    logging.error(f"Error processing {filename}: Empty text extracted.")
+                    continue
 
-            txtfile.write("=" * 40 + "\n")
-            txtfile.write(f"Drug Leaflet: {filename}\n")
-            txtfile.write("=" * 40 + "\n\n")
+                # The questions are independent of each other, so they are sent to the LLM concurrently
+                answers = await asyncio.gather(*(query_model(client, context, question, filename) for _, _, question in questions))
+                answers = dict(zip((predicate for _, predicate, _ in questions), answers))
 
-            drug_name = query_model(context, "What is the name of the drug/medicine? Provide only the name.", filename) or "Drug name not found"
-            txtfile.write(f"Q: What is the name of the drug/medicine?\n")
-            txtfile.write(f"A: {drug_name}\n\n")
+                # The follow-up refinements only depend on their own answer, so they also run concurrently
+                refined_predicates = [p for p in refinements if answers[p] is not None]
+                refined_results = await asyncio.gather(*(refinements[p](client, answers[p], filename) for p in refined_predicates))
+                refined = dict(zip(refined_predicates, refined_results))
 
-            for _, predicate, question in questions:
-                if predicate == "HAS_NAME":
-                    continue
+                txtfile.write("=" * 40 + "\n")
+                txtfile.write(f"Drug Leaflet: {filename}\n")
+                processed.add(filename)
+                txtfile.write("=" * 40 + "\n\n")
 
-                logging.info(f"Querying LLM for file: {filename} | Question: '{question}'")
-                answer = query_model(context, question, filename)
+                drug_name = answers["HAS_NAME"] or "Drug name not found"
+                txtfile.write(f"Q: What is the name of the drug/medicine?\n")
+                txtfile.write(f"A: {drug_name}\n\n")
 
-                if answer is None:
-                    logging.error(f"Skipping question for {filename} due to API failure: '{question}'")
-                    txtfile.write(f"Q: {question}\nA: [No response due to API timeout]\n\n")
-                    continue
+                for _, predicate, question in questions:
+                    if predicate == "HAS_NAME":
+                        continue
+
+                    answer = answers[predicate]
+
+                    if answer is None:
+                        logging.error(f"Skipping question for {filename} due to API failure: '{question}'")
+                        txtfile.write(f"Q: {question}\nA: [No response due to API timeout]\n\n")
+                        continue
+
+                    txtfile.write(f"Q: {question}\n")
+                    txtfile.write(f"A: {answer}\n\n")
+
+                    if predicate == "HAS_STORAGE_INFO":
+                        refined_storage = refined[predicate]
+                        txtfile.write(f"Q: Extract storage conditions into standardized format\n")
+                        txtfile.write(f"A: {refined_storage if refined_storage else '[No response]'}\n\n")
+
+                    elif predicate == "HAS_DOSAGE_INFO":
+                        dosage_list = refined[predicate]
+                        if not dosage_list:
+                            txtfile.write(f"Q: Extract categorized dosage information\nA: [No response]\n\n")
+                        else:
+                            txtfile.write(f"Q: Extract categorized dosage information\nA:\n")
+                            for dosage in dosage_list:
+                                txtfile.write(f"- {dosage}\n")
+                            txtfile.write("\n")
+
+                    elif predicate == "HAS_APPEARANCE":
+                        shapes, colors = refined[predicate]
+                        txtfile.write(f"Q: Extract only the shape of the drug\n")
+                        txtfile.write(f"A: {', '.join(shapes) if shapes else '[No response]'}\n\n")
+                        txtfile.write(f"Q: Extract only the color of the drug\n")
+                        txtfile.write(f"A: {', '.join(colors) if colors else '[No response]'}\n\n")
+
+                txtfile.write("\n\n")
+                logging.info("Sleeping for 5 seconds before processing next PDF...")
+                await asyncio.sleep(5)
 
-                txtfile.write(f"Q: {question}\n")
-                txtfile.write(f"A: {answer}\n\n")
-
-                if predicate == "HAS_STORAGE_INFO":
-                    refined_storage = extract_temperature_info(answer, filename)
-                    txtfile.write(f"Q: Extract storage conditions into standardized format\n")
-                    txtfile.write(f"A: {refined_storage if refined_storage else '[No response]'}\n\n")
-
-                elif predicate == "HAS_DOSAGE_INFO":
-                    dosage_list = extract_dosage_info(answer, filename)
-                    if not dosage_list:
-                        txtfile.write(f"Q: Extract categorized dosage information\nA: [No response]\n\n")
-                    else:
-                        txtfile.write(f"Q: Extract categorized dosage information\nA:\n")
-                        for dosage in dosage_list:
-                            txtfile.write(f"- {dosage}\n")
-                        txtfile.write("\n")
-
-                elif predicate == "HAS_APPEARANCE":
-                    shapes, colors = extract_appearance_info(answer, filename)
-                    txtfile.write(f"Q: Extract only the shape of the drug\n")
-                    txtfile.write(f"A: {', '.join(shapes) if shapes else '[No response]'}\n\n")
-                    txtfile.write(f"Q: Extract only the color of the drug\n")
-                    txtfile.write(f"A: {', '.join(colors) if colors else '[No response]'}\n\n")
-
-            txtfile.write("\n\n")
-            logging.info("Sleeping for 5 seconds before processing next PDF...")
-            time.sleep(5)
-
-    processed_count = sum(1 for line in open(output_txt, encoding="utf-8") if "Drug Leaflet:" in line)
-    total_pdfs = len([f for f in os.listdir(folder_path) if f.endswith(".pdf")])
+    processed_count = len(processed)
+    total_pdfs = len(pdf_files)
     skipped_count = total_pdfs - processed_count
 
     logging.info(f"Processing complete. Total PDFs processed: {processed_count}, Skipped: {skipped_count}")
@@ -224,4 +286,4 @@ def process_pdfs(folder_path):
 
 # ------------------ Main Execution ------------------
 if __name__ == "__main__":
-    process_pdfs(folder_path)
+    asyncio.run(process_pdfs(folder_path))
@@ -10,19 +10,41 @@ Script to extract and normalize medical terms from a text file using SciSpaCy an
 import spacy
 import nltk
 import argparse
+import os
+import mmap
+from multiprocessing import cpu_count
 
 # ------------------ Download required resources ------------------
 nltk.download("stopwords")
-nlp_bc5cdr = spacy.load("en_ner_bc5cdr_md")  
+try:
+    english_stopwords = frozenset(nltk.corpus.stopwords.words("english"))  # Loaded once for all lookups
+except LookupError:
+    print("Warning: NLTK stopwords not found, skipping stopword filtering.")
+    english_stopwords = frozenset()
+# Run the NER model on the GPU when one is available (requires spacy[cuda12x]), otherwise stay on the CPU
+using_gpu = spacy.prefer_gpu()
+# Only the NER output (doc.ents) is used, so the other pipeline components are not loaded
+nlp_bc5cdr = spacy.load("en_ner_bc5cdr_md", exclude=["tagger", "parser", "attribute_ruler", "lemmatizer"])
 
 # ------------------ Utility function(s) ------------------
-def extract_medical_terms(txt_file_path, output_path):
+def read_lines(path):
+    """Yield the decoded lines of a text file lazily through a read-only memory map."""
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:  # An empty file cannot be memory-mapped
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b""):
+                yield line.decode("utf-8")
+
+def extract_medical_terms(txt_file_path, output_path, batch_size=256, n_process=None):
     """
     Extracts, filters, and saves medical terms from a structured text file.
     
     Parameters:
     - txt_file_path (str): Path to the input text file
     - output_path (str): Path to save the output text file
+    - batch_size (int): Number of terms streamed through the NER model per batch
+    - n_process (int): Number of worker processes for the NER model (defaults to half the CPU cores, always 1 on GPU)
     """
     # These questions are used to identify relevant medical entities in the text file. The questions are based on the structure of the input text file and the expected answers.
     medical_questions = {
@@ -34,32 +56,35 @@ def extract_medical_terms(txt_file_path, output_path):
     }
     valid_medical_types = {"CHEMICAL", "DISEASE", "DRUG"}
     entities = []
-    with open(txt_file_path, "r", encoding="utf-8") as file:
-        lines = file.readlines()
-    for i, line in enumerate(lines):
-        line = line.strip()
+    expecting_answer = False  # True while the last question seen is one of medical_questions
+    for raw_line in read_lines(txt_file_path):
+        line = raw_line.strip()
         # Check if the line contains a relevant medical question from the list defined above
-        if any(line.startswith(f"Q: {question}") for question in medical_questions):
-            answer_line = next((l.strip() for l in lines[i + 1:] if l.startswith("A: ")), None)  # Extract the answer
-            if answer_line:
-                answer = answer_line.replace("A: ", "").strip()
-                if "," in answer:
-                    entities.extend([v.strip().lower() for v in answer.split(",")])
-                else:
-                    entities.append(answer.lower())
+        if line.startswith("Q: "):
+            expecting_answer = line[3:] in medical_questions
+        elif expecting_answer and raw_line.startswith("A: "):  # Extract the answer
+            expecting_answer = False
+            answer = line[3:].strip()
+            if "," in answer:
+                entities.extend([v.strip().lower() for v in answer.split(",")])
+            else:
+                entities.append(answer.lower())
+    if using_gpu:
+        n_process = 1  # Worker processes cannot share the GPU, so batches stay in this process
+    elif n_process is None:
+        n_process = max(1, cpu_count() // 2)
+    # The same terms recur across leaflets, so each unique non-empty term is run through the model only once.
+    # Pure stopword terms are dropped here as well, since they would be filtered out after NER anyway.
+    unique_terms = list(dict.fromkeys(term for term in entities if term and term not in english_stopwords))
     filtered_medical_terms = set()
-    for term in entities:
-        doc = nlp_bc5cdr(term)
+    # Stream all terms through the model in batches instead of one call per term
+    for doc in nlp_bc5cdr.pipe(unique_terms, batch_size=batch_size, n_process=n_process):
         for ent in doc.ents:
-            if ent.label_ in valid_medical_types:  
+            if ent.label_ in valid_medical_types:
                 filtered_medical_terms.add(ent.text)
-    try:
-        nltk_stopwords = set(nltk.corpus.stopwords.words("english"))
-        filtered_medical_terms = {
-            term for term in filtered_medical_terms if term.lower() not in nltk_stopwords
-        }
-    except LookupError:
-        print("Warning: NLTK stopwords not found, skipping stopword filtering.")
+    filtered_medical_terms = {
+        term for term in filtered_medical_terms if term.lower() not in english_stopwords
+    }
     with open(output_path, "w", encoding="utf-8") as f:
         for term in sorted(filtered_medical_terms):
             f.write(term + "\n")
@@ -70,6 +95,8 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Extract and normalize medical terms from the text file.")
     parser.add_argument("--input", required=True, help="Path to the input .txt file")
     parser.add_argument("--output", required=True, help="Path to save the final .txt file with extracted terms")
+    parser.add_argument("--batch_size", type=int, default=256, help="Number of terms per NER batch")
+    parser.add_argument("--n_process", type=int, default=None, help="Number of NER worker processes (default: half the CPU cores)")
     args = parser.parse_args()
 
-    extract_medical_terms(args.input, args.output)
+    extract_medical_terms(args.input, args.output, batch_size=args.batch_size, n_process=args.n_process)
@@ -15,6 +15,11 @@ import argparse
 import requests
 import time
 import os
+import threading
+import hashlib
+import diskcache
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 
 # ------------------ Argparse for Reproducibility ------------------
 parser = argparse.ArgumentParser(description="Post-process MEDAKA: clean comma-separated values and shorten long entities using LLM.")
@@ -24,28 +29,34 @@ parser.add_argument("--log_dir", required=True, help="Directory to store log fil
 parser.add_argument("--llm_url", required=True, help="URL of the LLM endpoint")
 parser.add_argument("--llm_model", required=True, help="Name of the model to be used")
 parser.add_argument("--mid_output", required=False, help="(Optional) Path to intermediate cleaned CSV")
+parser.add_argument("--cache_dir", default=".postprocess_llm_cache", help="Directory of the on-disk cache of LLM responses")
+parser.add_argument("--max_workers", type=int, default=16, help="Number of concurrent LLM requests")
 args = parser.parse_args()
 
 # ------------------ Phase 1: Expand comma-separated values ------------------
 csv_path = args.input
 mid_output = args.mid_output or os.path.splitext(csv_path)[0] + "_intermediate.csv"  # Auto-generate if not supplied
 
-df = pd.read_csv(csv_path, dtype=str, quotechar='"')
+df = pd.read_csv(csv_path, quotechar='"', engine="pyarrow", dtype_backend="pyarrow")  # Arrow parser and string columns
 object_column = "Object"
 
 def clean(df, object_col):
-    cleaned_data = []
-    for _, row in df.iterrows():
-        subject, predicate, obj = row["Subject"], row["Predicate"], str(row[object_col]).strip()
-        if obj.startswith('"') and obj.endswith('"'):
-            obj = obj[1:-1]
-        values = [v.strip() for v in obj.split(",") if v.strip()]
-        for value in values:
-            cleaned_data.append([subject, predicate, value])
-    return pd.DataFrame(cleaned_data, columns=["Subject", "Predicate", object_col])
-
-df_clean = clean(df, object_column)
-df_clean.to_csv(mid_output, index=False, quoting=csv.QUOTE_MINIMAL)
+    """Split comma-separated objects into one row per value using vectorized pandas string ops."""
+    objects = df[object_col].astype("string").str.strip()
+    objects = objects.str.replace(r'(?s)^"(.*)"$|^"$', r"\1", regex=True)  # Drop one pair of surrounding quotes
+    exploded = df.assign(**{object_col: objects.str.split(",")}).explode(object_col)
+    exploded[object_col] = exploded[object_col].astype("string").str.strip()
+    exploded = exploded[(exploded[object_col] != "").fillna(True)]  # Missing objects are kept as empty rows
+    return exploded[["Subject", "Predicate", object_col]].reset_index(drop=True)
+
+def write_clean(df, object_col, output_path, chunk_rows=100_000):
+    """Cleans the input in slices of rows and appends each slice to the CSV, so the expanded KG is never held in full."""
+    with open(output_path, "w", encoding="utf-8", newline="") as out:
+        for start in range(0, max(len(df), 1), chunk_rows):  # An empty input still writes the header
+            chunk = clean(df.iloc[start:start + chunk_rows], object_col)
+            chunk.to_csv(out, header=start == 0, index=False, quoting=csv.QUOTE_MINIMAL)
+
+write_clean(df, object_column, mid_output)
 print(f"Processed knowledge graph saved at {mid_output}")
 
 # ------------------ Phase 2: Shorten long entities using LLM ------------------
@@ -54,34 +65,53 @@ cleaned_csv_path = args.final_output
 llm_url = args.llm_url
 llm_model = args.llm_model
 
-df = pd.read_csv(mid_output)
+df = pd.read_csv(mid_output, engine="pyarrow", dtype_backend="pyarrow")
 columns_to_clean = ["Subject", "Object"]
 word_threshold = 3
 
 os.makedirs(log_dir, exist_ok=True)
 log_file_path = os.path.join(log_dir, f"kg_cleaning_log_{time.strftime('%Y-%m-%d_%H-%M-%S')}.txt")
 entity_cache = {}
+llm_cache = diskcache.Cache(args.cache_dir)  # Successful LLM responses, reused across runs
+max_workers = args.max_workers
+
+# One keep-alive session shared by all worker threads, with a connection pool sized to match
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+session.mount("http://", adapter)
+session.mount("https://", adapter)
+log_lock = threading.Lock()  # Worker threads log concurrently
 
 def log_message(message):
-    with open(log_file_path, "a") as log_file:
-        log_file.write(message + "\n")
-    print(message)
+    with log_lock:
+        with open(log_file_path, "a") as log_file:
+            log_file.write(message + "\n")
+        print(message)
+
+system_prompt = "You are an expert in biomedical terminology and drug information extraction. Ensure responses are concise (2-3 words), standardized, and medically accurate."
+max_tokens = 50
+
+def cache_key(context, question):
+    # The full request is part of the key, so changing the model, prompts or token limit never serves stale answers
+    key = "\x1f".join([llm_model, system_prompt, str(max_tokens), question, context])
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
 
 def query_model(context, question, retries=3, delay=5):
     data = {
         "model": llm_model,
         "messages": [
-            {"role": "system", "content": "You are an expert in biomedical terminology and drug information extraction. Ensure responses are concise (2-3 words), standardized, and medically accurate."},
+            {"role": "system", "content": system_prompt},
             {"role": "user", "content": f"Context: {context}\n\nQuestion: {question}"}
         ],
-        "max_tokens": 50,
+        "max_tokens": max_tokens,
     }
     for attempt in range(retries):
         try:
-            response = requests.post(llm_url, json=data)
+            response = session.post(llm_url, json=data)
             response.raise_for_status()
             result = response.json()["choices"][0]["message"]["content"].strip()
             entity_cache[context] = result
+            llm_cache.set(cache_key(context, question), result)
             log_message(f"API Success: {context} → {result}")
             return result
         except requests.exceptions.RequestException as e:
@@ -90,22 +120,36 @@ def query_model(context, question, retries=3, delay=5):
     log_message(f"API Failed after {retries} retries: Returning original entity → {context}")
     return context
 
-def shorten_entity(row, col_name, index):
-    entity = row[col_name]
-    if entity in entity_cache:
-        log_message(f"Using Cached Response for: {entity} → {entity_cache[entity]}")
-        return entity_cache[entity]
-    if isinstance(entity, str) and len(entity.split()) > word_threshold:
-        question = f"Convert the following medical term into a concise 2-3 word phrase while preserving its meaning: '{entity}'"
-        if index % 10 == 0:
-            log_message(f"Processing row {index}/{len(df)}: {entity}")
-        return query_model(entity, question)
-    return entity
+def shortening_question(entity):
+    return f"Convert the following medical term into a concise 2-3 word phrase while preserving its meaning: '{entity}'"
+
+def shorten_entity(entity):
+    return query_model(entity, shortening_question(entity))
 
 start_time = time.time()
 log_message("Starting entity cleaning process.")
+# Query each unique long entity once across both columns, concurrently, instead of once per row
+all_entities = pd.unique(pd.concat([df[col] for col in columns_to_clean], ignore_index=True))
+# Word counts for all unique values in one vectorized pass. Object dtype keeps Python's Unicode
+# whitespace rules, so the count matches len(entity.split()); non-strings count as 0 words.
+unique_series = pd.Series(all_entities, dtype=object)
+word_counts = pd.to_numeric(unique_series.str.count(r"\S+"), errors="coerce").fillna(0)
+long_entities = unique_series[word_counts > word_threshold].tolist()
+for entity in long_entities:
+    cached = llm_cache.get(cache_key(entity, shortening_question(entity)))  # Responses from earlier runs need no request
+    if cached is not None:
+        entity_cache[entity] = cached
+todo = [entity for entity in long_entities if entity not in entity_cache]
+log_message(f"{len(todo)} unique entities to shorten across {', '.join(columns_to_clean)}, {len(entity_cache)} cached responses")
+with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    futures = [executor.submit(shorten_entity, entity) for entity in todo]
+    for done, future in enumerate(as_completed(futures), 1):
+        future.result()
+        if done % 10 == 0:
+            log_message(f"Processed {done}/{len(todo)} entities")
+# Successful responses are in entity_cache, failed ones keep their original value
 for col in columns_to_clean:
-    df[col] = df.apply(lambda row: shorten_entity(row, col, row.name), axis=1)
+    df[col] = df[col].map(entity_cache).fillna(df[col])
 
 df.to_csv(cleaned_csv_path, index=False)
 end_time = time.time()